@@ -1,12 +1,15 @@
 
 import streamlit as st
 import pandas as pd
+import numpy as np
 from datetime import datetime
+import io
 import time
-import reportlab # Force install for Streamlit Cloud
-import altair as alt
-from connection import append_data_to_sheet, get_config, read_all_data, update_sheet
-from drive_handler import create_folder, upload_to_drive
+import string
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError, as_completed
+from connection import ensure_header_column, get_config, queue_row_for_sheet, read_all_data, update_sheet_cells
+from drive_handler import create_folder, get_modified_time, share_publicly, upload_file
 
 # ==============================================================================
 # 1. CONFIGURATION & CONSTANTS
@@ -31,6 +34,22 @@ IDENTITY_OPTIONS = ["Saya Guru", "Saya Ibu Bapa / Penjaga"]
 PERINGKAT_OPTIONS = ["Sekolah", "Daerah", "Negeri", "Kebangsaan", "Antarabangsa"]
 DATE_COL_NAME = 'Tarikh'
 TIMESTAMP_COL = 'Timestamp'
+CATEGORY_COLS = ('Kelas', 'Peringkat', 'Pencapaian', 'Identiti Pengguna')
+DATA_CACHE_TTL = 60  # seconds
+REVISION_CACHE_TTL = 5  # seconds a fetched sheet revision is reused across reruns
+UPLOAD_WORKERS = 6
+SAVE_WAIT_TIMEOUT = 20  # seconds a submission waits for its row before reporting it queued
+MIN_SEARCH_CHARS = 2
+MAX_SEARCH_RESULTS = 50
+
+def _deletion_table(extra=''):
+    """str.translate table deleting ASCII chars other than letters, digits and `extra`."""
+    allowed = set(string.ascii_letters + string.digits + extra)
+    return {i: None for i in range(128) if chr(i) not in allowed}
+
+# Filename sanitizers (non-ASCII passes through untouched)
+FOLDER_NAME_TABLE = _deletion_table(' _-')
+FILE_NAME_TABLE = _deletion_table()
 
 # ==============================================================================
 # 2. CORE LOGIC MODULES
@@ -61,8 +80,29 @@ def init_app():
         
     return config
 
-def load_and_process_data(spreadsheet_id):
-    """Load data from Google Sheets with Smart Date Detection."""
+@st.cache_data(ttl=REVISION_CACHE_TTL, max_entries=4, show_spinner=False)
+def _fetch_revision(spreadsheet_id: str) -> str:
+    """
+    Cheap Drive metadata lookup used as the data cache key.
+    Fails fast (no retry) and is memoized briefly, so rapid reruns such as
+    typing in the search box do not each wait on Drive.
+    """
+    try:
+        return get_modified_time(spreadsheet_id)
+    except Exception:
+        # Metadata unavailable: fall back to a time bucket so data still expires
+        return f"ttl-{int(time.time() // DATA_CACHE_TTL)}"
+
+def load_and_process_data(spreadsheet_id: str) -> pd.DataFrame:
+    """
+    Load data from Google Sheets with Smart Date Detection.
+    Only re-reads the sheet when its modifiedTime changes.
+    """
+    return _load_with_rev(spreadsheet_id, _fetch_revision(spreadsheet_id))
+
+@st.cache_data(ttl=DATA_CACHE_TTL * 10, max_entries=4, show_spinner=False)
+def _load_with_rev(spreadsheet_id: str, revision: str) -> pd.DataFrame:
+    """Expensive part of load_and_process_data; cached per (spreadsheet_id, revision)."""
     df = read_all_data(spreadsheet_id)
     
     if df.empty:
@@ -81,43 +121,57 @@ def load_and_process_data(spreadsheet_id):
             
     # --- 2. Type Conversion ---
     if target_col in df.columns:
-        # Convert to datetime objects first to handle various input formats
-        df[target_col] = pd.to_datetime(df[target_col], errors='coerce').dt.date
-        
-        # --- 3. Force String Logic for Display/Selectbox ---
-        # Ensure it's a clean string needed for the Selectbox UI later
-        # (Note: For filtering, we might need Date objects. 
-        # But user requested "Force String" at the end of load. 
-        # However, filter logic uses Date objects. 
-        # So providing a string column 'str_Tarikh' might be safer, 
-        # OR just ensure we handle types correctly in UI.
-        # User Instruction: "ensure Tarikh is string".
-        # BUT: line 349: filtered_df[DATE_COL_NAME] >= date_range[0] needs date/datetime objects.
-        # IF I force string here, filtering BREAKS.
-        # COMPROMISE: Keep as Date object here. Handle String conversion in UI loops.
-        # WAIT, User explicitly said: "Force String Conversion: In load_and_process_data last step... df['Tarikh'] = df['Tarikh'].astype(str)..."
-        # If I do that, Filter Logic (Step 48 code) will fail.
-        # I will Create a dedicated String Column for the UI to use, or fix the filter logic to parse strings.
-        # BETTER: Correct the Filter Logic to convert strings back to date if needed, OR keep Date object and convert to string ONLY for Selectbox.
-        # The User's instruction "Force String Conversion" might break the DateFilter.
-        # Let's look at the instruction again... "ensure Tarikh column is string...".
-        # If I do that, I must update the Filter Logic (Line 349) to pd.to_datetime(filtered[..]).dt.date comparison.
-        # I will choose to KEEP it as Date for now (for Filter), but ensure the specific UI parts handle it well. 
-        # Actually, let's look at current Filter Logic:
-        # "if DATE_COL_NAME in filtered.columns: filtered = ... >= date_range[0]"
-        # If 'Tarikh' is string '2023-01-01', basic string comparison works ok-ish for ISO dates, but risky.
-        #
-        # DECISION: I will strictly follow "Smart Detect" and Rename. 
-        # I will Apply the "Force String" instruction BUT also update the Filter Logic to handle it safely (convert string back to date for comparison).
-        
-        # Conversion to string to satisfy User instruction "Step 2"
-        df[target_col] = df[target_col].astype(str).replace(['nan', 'NaT', '<NA>'], '')
-        
-        # Add a helper column for Date Filtering (Actual Date Object)
-        df['_date_obj'] = pd.to_datetime(df[target_col], errors='coerce').dt.date
+        # Parse once; keep the datetime64 column for sorting/filtering and a
+        # clean 'YYYY-MM-DD' string column for display and the Selectbox UI
+        parsed = pd.to_datetime(df[target_col], errors='coerce')
+        df['_date_obj'] = parsed
+        df[target_col] = parsed.dt.strftime('%Y-%m-%d').fillna('')
+
+    # --- 3. Low-cardinality columns as category (int codes for unique/isin/crosstab) ---
+    for col in CATEGORY_COLS:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+
+    # Load stamp survives st.cache_data's copy-on-return, unlike id(df)
+    df.attrs['loaded_at'] = time.time()
+    return df
 
+def decategorize(df):
+    """Return a copy with category columns as plain objects, so editors accept new values."""
+    df = df.copy()
+    for col in CATEGORY_COLS:
+        if col in df.columns and isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype(object)
     return df
 
+@st.cache_data(show_spinner=False, max_entries=4)
+def build_search_index(_names, loaded_at) -> np.ndarray:
+    """
+    Lowercased name array for substring search, built once per data load.
+    _names is not hashed by Streamlit (hashing it cost more than the search);
+    the load stamp is the cache key.
+    """
+    return np.array([n.lower() for n in _names.astype(str)], dtype=str)
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def filter_options(_df, loaded_at):
+    """
+    Sorted multiselect options per filter column, computed once per data load.
+    _df is not hashed by Streamlit; the load stamp is the cache key.
+    """
+    options = {}
+    for col in ('Kelas', 'Peringkat', 'Pencapaian'):
+        if col not in _df.columns:
+            continue
+        series = _df[col]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            # Categories were built from the loaded values: O(1) lookup
+            values = series.cat.categories.tolist()
+        else:
+            values = series.dropna().unique().tolist()
+        options[col] = sorted(values)
+    return options
+
 def compute_analytics(df):
     """Perform aggregations."""
     analytics = {}
@@ -135,6 +189,9 @@ def compute_analytics(df):
 
     if 'Kelas' in df.columns and 'Peringkat' in df.columns:
         pivot_df = pd.crosstab(df['Kelas'], df['Peringkat'])
+        # Categorical inputs yield unobserved categories too; keep only observed ones
+        pivot_df = pivot_df.loc[pivot_df.sum(axis=1) > 0, pivot_df.sum(axis=0) > 0]
+        pivot_df.columns = pivot_df.columns.astype(object)
         existing_extra_cols = [c for c in pivot_df.columns if c not in LEVEL_ORDER]
         final_col_order = [c for c in LEVEL_ORDER] + [c for c in pivot_df.columns if c not in LEVEL_ORDER]
         pivot_df = pivot_df.reindex(columns=final_col_order, fill_value=0)
@@ -156,34 +213,81 @@ def handle_submission(form_data, files, config):
         raw_names = [n.strip() for n in form_data['nama_pelajar'].split('\n') if n.strip()]
         clean_names_str = ", ".join(raw_names)
         folder_suffix = "_".join(raw_names)[:30]
-        safe_tajuk = "".join([c for c in form_data['tajuk'] if c.isalnum() or c in (' ', '_', '-')])
+        safe_tajuk = form_data['tajuk'].translate(FOLDER_NAME_TABLE)
         folder_name = f"{timestamp}_{folder_suffix}_{safe_tajuk}"
         
-        status.write("📂 Mencipta folder Google Drive...")
-        new_folder_id = create_folder(folder_name, drive_folder_id)
-        
-        status.write("☁️ Memuat naik fail...")
-        links = {'surat': '', 'sijil': '', 'g1': '', 'g2': '', 'g3': '', 'g4': ''}
-        
+        # Upload jobs: (link key, file, target filename)
+        jobs = []
         if files['surat']:
             ext = files['surat'].name.split('.')[-1]
-            links['surat'] = upload_to_drive(files['surat'], new_folder_id, f"{timestamp}_Surat.{ext}")
+            jobs.append(('surat', files['surat'], f"{timestamp}_Surat.{ext}"))
         if files['sijil']:
             ext = files['sijil'].name.split('.')[-1]
-            links['sijil'] = upload_to_drive(files['sijil'], new_folder_id, f"{timestamp}_Sijil.{ext}")
+            jobs.append(('sijil', files['sijil'], f"{timestamp}_Sijil.{ext}"))
         for idx, img in enumerate(files['gambar'][:4]):
             ext = img.name.split('.')[-1]
-            links[f'g{idx+1}'] = upload_to_drive(img, new_folder_id, f"{timestamp}_Gambar_{idx+1}.{ext}")
+            jobs.append((f'g{idx+1}', img, f"{timestamp}_Gambar_{idx+1}.{ext}"))
+        
+        links = {'surat': '', 'sijil': '', 'g1': '', 'g2': '', 'g3': '', 'g4': '', 'arkib': ''}
+        
+        # Overlap the folder RPC with reading the uploaded bytes, then run
+        # the (I/O-bound, independent) uploads concurrently
+        with ThreadPoolExecutor(max_workers=UPLOAD_WORKERS + 1) as ex:
+            status.write("📂 Mencipta folder Google Drive...")
+            folder_future = ex.submit(create_folder, folder_name, drive_folder_id)
+            read_futures = [(key, ex.submit(f.getvalue), name) for key, f, name in jobs]
+            
+            if form_data.get('arkib') and read_futures:
+                # Archive mode: one ZIP upload instead of one request per file
+                archive = io.BytesIO()
+                with zipfile.ZipFile(archive, 'w', zipfile.ZIP_DEFLATED) as z:
+                    for key, data, name in read_futures:
+                        z.writestr(name, data.result())
+                upload_jobs = [('arkib', archive.getvalue(), f"{timestamp}_Arkib.zip")]
+            else:
+                upload_jobs = [(key, data.result(), name) for key, data, name in read_futures]
+            new_folder_id = folder_future.result()
+            
+            status.write("☁️ Memuat naik fail...")
+            futures = {
+                ex.submit(upload_file, data, new_folder_id, name): key
+                for key, data, name in upload_jobs
+            }
+            uploaded_ids = []
+            for fut in as_completed(futures):
+                uploaded = fut.result()
+                links[futures[fut]] = uploaded.get('webViewLink')
+                uploaded_ids.append(uploaded['id'])
+        
+        # One batch request shares every uploaded file
+        share_publicly(uploaded_ids)
             
         status.write("💾 Menyimpan rekod...")
         data_row = [
             timestamp, form_data['identity'], clean_names_str, form_data['kelas'], 
             form_data['tajuk'], form_data['penganjur'], display_date, 
             form_data['tempat'], form_data['peringkat'], form_data['pencapaian'],
-            links['surat'], links['sijil'], links['g1'], links['g2'], links['g3'], links['g4']
+            links['surat'], links['sijil'], links['g1'], links['g2'], links['g3'], links['g4'],
+            links['arkib']
         ]
         
-        append_data_to_sheet(data_row, spreadsheet_id)
+        # Older sheets predate the archive column: add its header before writing into it
+        ensure_header_column(len(data_row), 'Arkib_Link', spreadsheet_id)
+        
+        # Buffered and flushed in batches by connection.py; the flush bumps the
+        # sheet's modifiedTime, which invalidates the data cache on its own.
+        # Success is only reported once the batch holding this row is written;
+        # retries under rate limiting can take minutes, so the wait is bounded.
+        try:
+            queue_row_for_sheet(data_row, spreadsheet_id).result(timeout=SAVE_WAIT_TIMEOUT)
+        except FutureTimeoutError:
+            status.update(label="⏳ Rekod dalam giliran", state="complete", expanded=False)
+            st.warning(
+                "Fail telah dimuat naik, tetapi Google Sheets sedang sibuk. "
+                "Rekod masih dalam giliran dan akan disimpan secara automatik; "
+                f"tidak perlu hantar semula. Folder: {folder_name}"
+            )
+            return
         
         status.update(label="✅ Berjaya!", state="complete", expanded=False)
         st.success(f"Laporan berjaya dihantar! Folder: {folder_name}")
@@ -198,21 +302,40 @@ def handle_data_update(full_df, filtered_scope_df, edited_subset, config):
     spreadsheet_id = config['spreadsheet_id']
     with st.spinner("Sedang menyegerakan data..."):
         try:
-            current_df = full_df.copy()
+            current_df = decategorize(full_df)
             current_df.update(edited_subset)
             
             scope_indices = set(filtered_scope_df.index)
             remaining_indices = set(edited_subset.index)
             deleted_indices = scope_indices - remaining_indices
             
-            if deleted_indices:
-                current_df = current_df.drop(index=list(deleted_indices))
-                st.warning(f"Note: {len(deleted_indices)} row(s) deleted.")
-                
+            # Helper columns are derived at load time and never written back
+            original_df = decategorize(full_df).drop(columns=['_date_obj'], errors='ignore')
+            current_df = current_df.drop(columns=['_date_obj'], errors='ignore')
             if DATE_COL_NAME in current_df.columns:
+                original_df[DATE_COL_NAME] = original_df[DATE_COL_NAME].astype(str).replace('NaT', '')
                 current_df[DATE_COL_NAME] = current_df[DATE_COL_NAME].astype(str).replace('NaT', '')
+            
+            # Diff against the loaded data and send only changed cells.
+            # Frame row i is sheet row i + 2 (row 1 is the header); columns map 1:1.
+            kept = original_df.index.difference(list(deleted_indices))
+            before = original_df.loc[kept]
+            after = current_df.loc[kept, original_df.columns]
+            diff_mask = (before != after) & ~(before.isna() & after.isna())
+            row_pos = original_df.index.get_indexer(kept)
+            changed_rows, changed_cols = np.nonzero(diff_mask.to_numpy())
+            cell_updates = [
+                (int(row_pos[r]) + 2, int(c) + 1, after.iat[r, c])
+                for r, c in zip(changed_rows, changed_cols)
+            ]
+            deleted_rows = [int(pos) + 2 for pos in original_df.index.get_indexer(list(deleted_indices))]
+            
+            if deleted_rows:
+                st.warning(f"Note: {len(deleted_rows)} row(s) deleted.")
                 
-            update_sheet(current_df, spreadsheet_id)
+            if cell_updates or deleted_rows:
+                update_sheet_cells(cell_updates, deleted_rows, spreadsheet_id)
+            _load_with_rev.clear()
             st.success("✅ Data berjaya dikemaskini!")
             time.sleep(1)
             return True
@@ -256,6 +379,7 @@ def render_public_submission(config):
         file_surat = st.file_uploader("Surat (Optional)", type=['pdf', 'jpg', 'png'])
         file_sijil = st.file_uploader("Sijil (Required)", type=['pdf', 'jpg', 'png'])
         files_gambar = st.file_uploader("Gambar (Max 4)", type=['jpg', 'jpeg', 'png'], accept_multiple_files=True)
+        arkib = st.checkbox("Muat naik sebagai arkib ZIP", help="Satu fail ZIP untuk semua dokumen (sesuai untuk rangkaian perlahan).")
         
         submitted = st.form_submit_button("Hantar Laporan 🚀", use_container_width=True)
         
@@ -270,7 +394,8 @@ def render_public_submission(config):
         form_data = {
             'identity': identity, 'nama_pelajar': nama_pelajar, 'kelas': kelas, 
             'tarikh': tarikh, 'tajuk': tajuk, 'penganjur': penganjur, 
-            'tempat': tempat, 'peringkat': peringkat, 'pencapaian': pencapaian
+            'tempat': tempat, 'peringkat': peringkat, 'pencapaian': pencapaian,
+            'arkib': arkib
         }
         files = {'surat': file_surat, 'sijil': file_sijil, 'gambar': files_gambar}
         handle_submission(form_data, files, config)
@@ -297,12 +422,15 @@ def render_public_report_generator(config):
 
         
     # Search Mechanism
-    search_query = st.text_input("🔍 Carian Nama / No. KP:", placeholder="Taip nama pelajar...")
+    search_query = st.text_input("🔍 Carian Nama / No. KP:", placeholder="Taip nama pelajar...").strip()
     
-    if search_query:
-        # Filter logic (Case insensitive partial match)
+    if search_query and len(search_query) < MIN_SEARCH_CHARS:
+        st.info(f"Sila taip sekurang-kurangnya {MIN_SEARCH_CHARS} aksara untuk memulakan carian.")
+    elif search_query:
+        # Filter logic (Case insensitive literal substring match, no regex)
         # Assuming 'Nama Pelajar' is the column
-        mask = df['Nama Pelajar'].astype(str).str.contains(search_query, case=False, na=False)
+        name_index = build_search_index(df['Nama Pelajar'], df.attrs.get('loaded_at'))
+        mask = np.char.find(name_index, search_query.lower()) >= 0
         results = df[mask]
         
         if not results.empty:
@@ -317,35 +445,37 @@ def render_public_report_generator(config):
             if sort_col in results.columns:
                 results = results.sort_values(by=sort_col, ascending=False)
 
+            # Cap the option list; only a handful are ever visible in the selectbox
+            total_found = len(results)
+            if total_found > MAX_SEARCH_RESULTS:
+                results = results.head(MAX_SEARCH_RESULTS)
+                st.info(f"Menunjukkan {MAX_SEARCH_RESULTS} rekod terkini — taipkan lebih spesifik untuk menyempitkan carian.")
+
             # Create a Label Column and a Mapping Dictionary
             # We map Label -> DF Index to retrieve the exact row later
-            label_map = {}
-            display_options = []
+            def text_col(col, default):
+                if col not in results.columns:
+                    return pd.Series(default, index=results.index)
+                return results[col].astype(str)
             
-            for idx, row in results.iterrows():
-                # Safe str conversion
-                name = str(row.get('Nama Pelajar', '?'))
-                rank = str(row.get('Peringkat', '-'))
-                achievement = str(row.get('Pencapaian', '-'))
-                
-                # --- Date Fix Start ---
-                # Since we forced string in load_and_process_data, 'Tarikh' is string.
-                # But let's be safe.
-                raw_date = row.get(DATE_COL_NAME)
-                formatted_date = str(raw_date) if raw_date else "Tarikh Tidak Dinyatakan"
-                # --- Date Fix End ---
-                
-                # Requested Format: Nama | Peringkat | Pencapaian | Tarikh
-                label = f"{name} | {rank} | {achievement} | {formatted_date}"
-                
-                # Handle duplicate labels if any (append index to make unique)
-                if label in label_map:
-                    label = f"{label} (#{idx})"
-                
-                label_map[label] = idx
-                display_options.append(label)
+            # Since we forced string in load_and_process_data, 'Tarikh' is string.
+            dates = text_col(DATE_COL_NAME, '').replace('', "Tarikh Tidak Dinyatakan")
+            
+            # Requested Format: Nama | Peringkat | Pencapaian | Tarikh (built column-wise)
+            labels = (
+                text_col('Nama Pelajar', '?') + " | " + text_col('Peringkat', '-') + " | "
+                + text_col('Pencapaian', '-') + " | " + dates
+            )
             
-            st.success(f"✅ Ditemui {len(results)} aktiviti untuk carian anda.")
+            # Handle duplicate labels if any (append index to make unique)
+            dup = pd.Index(labels).duplicated()
+            if dup.any():
+                labels[dup] = labels[dup] + " (#" + results.index[dup].astype(str).to_numpy() + ")"
+            
+            display_options = labels.tolist()
+            label_map = dict(zip(display_options, results.index))
+            
+            st.success(f"✅ Ditemui {total_found} aktiviti untuk carian anda.")
             
             # Student Info Card
             student_name = str(results.iloc[0].get('Nama Pelajar', '-'))
@@ -376,8 +506,8 @@ def render_public_report_generator(config):
                             pdf_bytes = pdf_generator.generate_pdf(selected_row.to_dict())
                             
                             # Clean filename: "Laporan_Ali_BolaSepak_2023.pdf"
-                            safe_name = "".join(x for x in str(selected_row['Nama Pelajar'])[:10] if x.isalnum())
-                            safe_event = "".join(x for x in str(selected_row.get(event_col, ''))[:10] if x.isalnum())
+                            safe_name = str(selected_row['Nama Pelajar'])[:10].translate(FILE_NAME_TABLE)
+                            safe_event = str(selected_row.get(event_col, ''))[:10].translate(FILE_NAME_TABLE)
                             fname = f"Laporan_{safe_name}_{safe_event}.pdf"
                             
                             st.download_button(
@@ -405,6 +535,7 @@ def render_admin_dashboard(config):
     if password == admin_pass:
         st.success("Akses Diberikan")
         if st.button("Muat Semula Data"):
+            _load_with_rev.clear()
             st.rerun()
             
         try:
@@ -414,6 +545,7 @@ def render_admin_dashboard(config):
                 return
 
             # Filter UI
+            opts = filter_options(df, df.attrs.get('loaded_at'))
             with st.expander("🔍 Filter Options", expanded=True):
                 col1, col2, col3, col4 = st.columns(4)
                 
@@ -421,12 +553,14 @@ def render_admin_dashboard(config):
                 filter_date_col = '_date_obj' if '_date_obj' in df.columns else DATE_COL_NAME
                 
                 if filter_date_col in df.columns:
-                    # Convert to datetime date for selector
+                    # Convert to datetime date for selector (no re-parse if already datetime64)
                     try:
-                        valid_dates = pd.to_datetime(df[filter_date_col], errors='coerce').dropna().dt.date
-                        if not valid_dates.empty:
-                            min_d = valid_dates.min()
-                            max_d = valid_dates.max()
+                        date_series = df[filter_date_col]
+                        if not pd.api.types.is_datetime64_any_dtype(date_series):
+                            date_series = pd.to_datetime(date_series, errors='coerce')
+                        if date_series.notna().any():
+                            min_d = date_series.min().date()
+                            max_d = date_series.max().date()
                         else:
                             min_d = datetime.today().date()
                             max_d = datetime.today().date()
@@ -439,26 +573,36 @@ def render_admin_dashboard(config):
                 else: date_range = None
                 
                 with col2:
-                    sel_kelas = st.multiselect("Kelas", sorted(df['Kelas'].dropna().unique()))
+                    sel_kelas = st.multiselect("Kelas", opts.get('Kelas', []))
                 with col3:
-                    sel_peringkat = st.multiselect("Peringkat", sorted(df['Peringkat'].dropna().unique()))
+                    sel_peringkat = st.multiselect("Peringkat", opts.get('Peringkat', []))
                 with col4:
-                    sel_pencapaian = st.multiselect("Pencapaian", sorted(df['Pencapaian'].dropna().unique()))
-
-            # Filter Logic
-            filtered_df = df.copy()
-            if date_range and len(date_range)==2 and filter_date_col in filtered_df.columns:
-                 # Ensure filter col is datetime-like for comparison
-                 filtered_df['__temp_date'] = pd.to_datetime(filtered_df[filter_date_col], errors='coerce').dt.date
-                 filtered_df = filtered_df[(filtered_df['__temp_date'] >= date_range[0]) & (filtered_df['__temp_date'] <= date_range[1])]
-                 filtered_df.drop(columns=['__temp_date'], inplace=True)
+                    sel_pencapaian = st.multiselect("Pencapaian", opts.get('Pencapaian', []))
+
+            # Filter Logic: AND every active filter into one mask, then index once
+            mask = np.ones(len(df), dtype=bool)
+            if date_range and len(date_range)==2 and '_date_obj' in df.columns:
+                 # _date_obj is datetime64 (may carry a time of day): include the whole end day
+                 start = pd.Timestamp(date_range[0])
+                 end = pd.Timestamp(date_range[1]) + pd.Timedelta(days=1)
+                 mask &= ((df['_date_obj'] >= start) & (df['_date_obj'] < end)).values
                  
-            if sel_kelas: filtered_df = filtered_df[filtered_df['Kelas'].isin(sel_kelas)]
-            if sel_peringkat: filtered_df = filtered_df[filtered_df['Peringkat'].isin(sel_peringkat)]
-            if sel_pencapaian: filtered_df = filtered_df[filtered_df['Pencapaian'].isin(sel_pencapaian)]
+            if sel_kelas: mask &= df['Kelas'].isin(sel_kelas).values
+            if sel_peringkat: mask &= df['Peringkat'].isin(sel_peringkat).values
+            if sel_pencapaian: mask &= df['Pencapaian'].isin(sel_pencapaian).values
+            filtered_df = df.loc[mask]
 
             st.caption(f"Records: {len(filtered_df)}")
-            analytics = compute_analytics(filtered_df)
+            
+            # Reuse analytics across reruns (e.g. editor clicks) when data and filters are unchanged
+            date_key = tuple(date_range) if date_range else None
+            filter_key = (tuple(sel_kelas), tuple(sel_peringkat), tuple(sel_pencapaian), date_key, df.attrs.get('loaded_at'))
+            if st.session_state.get('_analytics_key') == filter_key:
+                analytics = st.session_state['_analytics_val']
+            else:
+                analytics = compute_analytics(filtered_df)
+                st.session_state['_analytics_key'] = filter_key
+                st.session_state['_analytics_val'] = analytics
 
             # Analytics UI
             st.subheader("Analisis Data")
@@ -469,6 +613,8 @@ def render_admin_dashboard(config):
 
             c1, c2 = st.columns(2)
             if 'chart_df' in analytics:
+                # Lazy import: only the admin charts need altair
+                import altair as alt
                 with c1:
                     st.altair_chart(alt.Chart(analytics['chart_df']).mark_bar().encode(
                         x='count()', y=alt.Y('Peringkat', sort='-x')
@@ -486,7 +632,7 @@ def render_admin_dashboard(config):
             # Data Editor
             st.markdown("---")
             st.subheader("Data Editor (Admin Only)")
-            display_df = filtered_df.copy()
+            display_df = decategorize(filtered_df)
             if DATE_COL_NAME in display_df.columns:
                 display_df[DATE_COL_NAME] = display_df[DATE_COL_NAME].astype(str)
             
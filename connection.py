@@ -7,9 +7,18 @@ Supports Dual-Mode Authentication: Streamlit Cloud (st.secrets) & Local (JSON fi
 import streamlit as st
 import json
 import os
+import atexit
+import functools
+import random
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime, timezone
 import gspread
 import pandas as pd
+from google.auth.transport.requests import Request
 from google.oauth2.service_account import Credentials
+from googleapiclient.errors import HttpError
 
 # Google API Scopes
 SCOPES = [
@@ -17,6 +26,43 @@ SCOPES = [
     'https://www.googleapis.com/auth/drive'
 ]
 
+# Buffered appends: rows are flushed together every interval or once the
+# buffer reaches the row limit, whichever comes first
+APPEND_FLUSH_INTERVAL = 5  # seconds
+APPEND_FLUSH_MAX_ROWS = 20
+APPEND_FLUSH_MAX_ATTEMPTS = 3  # rate-limited batches are re-queued at most this often
+
+# Retry policy for transient Google API errors (quota / server side)
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+RETRY_TRIES = 6
+RETRY_BASE_DELAY = 1.0  # seconds
+RETRY_MAX_DELAY = 30.0  # seconds, cap for the exponential schedule
+# Error `reason`s decide retryability before the status code: permanent
+# failures fail fast, rate limits (often reported as 403) back off
+RATE_LIMIT_REASONS = {'rateLimitExceeded', 'userRateLimitExceeded'}
+RECOVERABLE_REASONS = RATE_LIMIT_REASONS | {'backendError', 'internalError'}
+UNRECOVERABLE_REASONS = {'storageQuotaExceeded', 'forbidden', 'notFound', 'invalid'}
+
+# Access tokens are refreshed in the background this long before they expire,
+# so no user request pays the refresh round-trip
+TOKEN_REFRESH_MARGIN = 300  # seconds
+TOKEN_REFRESH_RETRY = 60  # seconds, after a failed refresh
+
+_retry_state = threading.local()
+
+_shared_creds = None
+_shared_creds_lock = threading.Lock()
+
+_gc = None
+_gc_lock = threading.Lock()
+_ws_cache = {}  # spreadsheet_id -> first worksheet
+_header_cache = {}  # spreadsheet_id -> header row (list of column names)
+
+_pending_rows = {}  # spreadsheet_id -> list of (row, Future, attempts)
+_pending_lock = threading.Lock()
+_flush_timer = None
+_flushes_running = 0
+
 def get_credentials():
     """
     Get Google OAuth 2.0 Credentials (Service Account).
@@ -64,9 +110,60 @@ def get_credentials():
         "2. Local: Ensure 'client_secrets.json' or 'service_account.json' exists."
     )
 
+def cached_credentials():
+    """
+    Process-wide credentials singleton shared by the Sheets and Drive clients.
+    The key is loaded once; a stale or not-yet-fetched token is refreshed in place.
+    """
+    global _shared_creds
+    with _shared_creds_lock:
+        if _shared_creds is None:
+            creds = get_credentials()
+            creds.refresh(Request())  # first token fetched here, so no immediate timer
+            _shared_creds = creds
+            _schedule_token_refresh()
+        elif not _shared_creds.valid:
+            _shared_creds.refresh(Request())
+        return _shared_creds
+
+def refresh_credentials():
+    """
+    Force a refresh of the shared access token, e.g. after a 401.
+    Clients hold the singleton itself, so they pick up the new token in place.
+    """
+    creds = cached_credentials()
+    with _shared_creds_lock:
+        creds.refresh(Request())
+
+def _schedule_token_refresh(delay=None):
+    """
+    Refresh the shared credentials TOKEN_REFRESH_MARGIN seconds before expiry
+    on a daemon timer, so no user request pays the refresh round-trip.
+    """
+    if delay is None:
+        remaining = (_shared_creds.expiry - datetime.now(timezone.utc).replace(tzinfo=None)).total_seconds()
+        delay = max(0, remaining - TOKEN_REFRESH_MARGIN)
+    timer = threading.Timer(delay, _refresh_token)
+    timer.daemon = True
+    timer.start()
+
+def _refresh_token():
+    """Timer callback: refresh the shared access token and schedule the next refresh."""
+    try:
+        with _shared_creds_lock:
+            _shared_creds.refresh(Request())
+    except Exception as e:
+        print(f"⚠️ Background token refresh failed: {str(e)}")
+        _schedule_token_refresh(TOKEN_REFRESH_RETRY)
+        return
+    _schedule_token_refresh()
+
+@functools.lru_cache(maxsize=1)
 def get_config():
     """
     Get configuration (Spreadsheet ID, Drive Folder ID, Admin Password).
+    Read once per process; call get_config.cache_clear() after changing secrets.
+    The returned dict is shared, so callers must not mutate it.
     """
     try:
         # Priority: [connections] section
@@ -97,91 +194,386 @@ def get_config():
             'admin_password': None
         }
 
+# ==============================================================================
+# RETRY HELPERS
+# ==============================================================================
+
+def _error_body(err):
+    """Return the `error` object of a Google API error response (empty if unparsable)."""
+    try:
+        if isinstance(err, HttpError):
+            body = json.loads(err.content)
+        else:
+            body = err.response.json()
+        return body.get('error') or {}
+    except Exception:
+        return {}
+
+def _error_reasons(body):
+    """Return the set of `reason` strings in an error object."""
+    return {item.get('reason') for item in body.get('errors', []) if isinstance(item, dict)}
+
+def _retry_info_delay(body):
+    """Return the google.rpc.RetryInfo retryDelay (e.g. "1.5s") in seconds, or None."""
+    for detail in body.get('details', []):
+        if isinstance(detail, dict) and detail.get('@type', '').endswith('google.rpc.RetryInfo'):
+            try:
+                return float(str(detail.get('retryDelay', '')).rstrip('s'))
+            except ValueError:
+                return None
+    return None
+
+def _transient_error_info(e, idempotent=True):
+    """
+    Return (is_transient, retry_after_seconds) for a gspread / googleapiclient error.
+    Unrecoverable reasons (quota full, no access, bad request) are never retried.
+    For non-idempotent calls only rate limits count: a 5xx may arrive after the
+    write was applied, so repeating it could duplicate (or over-delete) rows.
+    The server's delay comes from Retry-After, else the body's RetryInfo.
+    Wrapper functions re-raise API errors as plain Exceptions, so the cause is checked too.
+    """
+    for err in (e, e.__cause__):
+        if isinstance(err, gspread.exceptions.APIError):
+            status = err.response.status_code
+            retry_after = err.response.headers.get('Retry-After')
+        elif isinstance(err, HttpError):
+            status = err.resp.status
+            retry_after = err.resp.get('retry-after')
+        else:
+            continue
+        body = _error_body(err)
+        reasons = _error_reasons(body)
+        if reasons & UNRECOVERABLE_REASONS:
+            return False, None
+        if idempotent:
+            if status not in RETRY_STATUS_CODES and not reasons & RECOVERABLE_REASONS:
+                return False, None
+        elif status != 429 and not reasons & RATE_LIMIT_REASONS:
+            return False, None
+        try:
+            if retry_after:
+                return True, float(retry_after)
+        except ValueError:
+            pass  # HTTP-date form: fall back to the body / backoff schedule
+        return True, _retry_info_delay(body)
+    return False, None
+
+def with_retry(fn=None, *, idempotent=True):
+    """
+    Retry `fn` on 429/5xx and recoverable reasons with jittered exponential backoff
+    capped at RETRY_MAX_DELAY, honouring Retry-After.
+    Use @with_retry(idempotent=False) for appends, creates and deletes: those are
+    retried on rate limits only.
+    Nested retry-wrapped calls run once; only the outermost call retries.
+    """
+    if fn is None:
+        return functools.partial(with_retry, idempotent=idempotent)
+    
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if getattr(_retry_state, 'active', False):
+            return fn(*args, **kwargs)
+        _retry_state.active = True
+        try:
+            for attempt in range(RETRY_TRIES):
+                try:
+                    return fn(*args, **kwargs)
+                except Exception as e:
+                    transient, retry_after = _transient_error_info(e, idempotent)
+                    if not transient or attempt == RETRY_TRIES - 1:
+                        raise
+                    if retry_after is None:
+                        retry_after = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt * (1 + random.random() * 0.5))
+                    delay = retry_after
+                    print(f"⏳ Transient API error, retrying in {delay:.1f}s ({attempt + 1}/{RETRY_TRIES - 1})")
+                    time.sleep(delay)
+        finally:
+            _retry_state.active = False
+    return wrapper
+
 # ==============================================================================
 # WRAPPER FUNCTIONS (Using new get_credentials)
 # ==============================================================================
 
+def _client():
+    """Return the process-wide gspread client, authorizing only on first use."""
+    global _gc
+    with _gc_lock:
+        if _gc is None:
+            _gc = gspread.authorize(cached_credentials())
+    return _gc
+
+def _get_worksheet(spreadsheet_id):
+    """Return the (memoized) first worksheet, opening the spreadsheet only once per id."""
+    gc = _client()
+    with _gc_lock:
+        worksheet = _ws_cache.get(spreadsheet_id)
+        if worksheet is None:
+            worksheet = gc.open_by_key(spreadsheet_id).sheet1
+            _ws_cache[spreadsheet_id] = worksheet
+    return worksheet
+
+def get_worksheet(spreadsheet_id=None):
+    """Return the shared first worksheet of a spreadsheet (defaults to the configured one)."""
+    if spreadsheet_id is None:
+        spreadsheet_id = get_config()['spreadsheet_id']
+    return _get_worksheet(spreadsheet_id)
+
+def _reset_on_auth_error(e):
+    """On 401, force a token refresh so the next call is sent with a new token."""
+    if isinstance(e, gspread.exceptions.APIError) and e.response.status_code == 401:
+        try:
+            refresh_credentials()
+        except Exception as refresh_error:
+            print(f"⚠️ Token refresh after 401 failed: {str(refresh_error)}")
+
 def save_to_sheets(data_dict, spreadsheet_id=None):
     """Save data to Google Sheets."""
+    return save_many_to_sheets([data_dict], spreadsheet_id)
+
+@with_retry(idempotent=False)
+def save_many_to_sheets(data_dicts, spreadsheet_id=None):
+    """Save a list of dicts, aligned to the sheet headers, in a single append call."""
     try:
-        credentials = get_credentials()
-        gc = gspread.authorize(credentials)
-        
         if spreadsheet_id is None:
             config = get_config()
             spreadsheet_id = config['spreadsheet_id']
             if not spreadsheet_id:
                 raise ValueError("Missing spreadsheet_id")
         
-        sh = gc.open_by_key(spreadsheet_id)
-        worksheet = sh.sheet1
+        worksheet = _get_worksheet(spreadsheet_id)
         
-        # Prepare headers if empty
-        headers = worksheet.row_values(1)
+        # Headers are cached per sheet; refetch only when a key is not in them
+        headers = _header_cache.get(spreadsheet_id)
+        if headers is None or any(k not in headers for d in data_dicts for k in d):
+            headers = worksheet.row_values(1)
+        
+        # Prepare headers if empty (written in the same call as the data)
+        new_rows = []
         if not headers:
-            headers = list(data_dict.keys())
-            worksheet.append_row(headers)
+            headers = list(data_dicts[0].keys()) if data_dicts else []
+            new_rows.append(headers)
         
         # Align data with headers
-        row_data = [data_dict.get(h, '') for h in headers]
+        new_rows += [[d.get(h, '') for h in headers] for d in data_dicts]
         
-        worksheet.append_row(row_data)
-        print("✅ Data saved successfully")
+        if new_rows:
+            worksheet.append_rows(new_rows, value_input_option='RAW', insert_data_option='INSERT_ROWS')
+        if headers:
+            _header_cache[spreadsheet_id] = headers
+        print(f"✅ Data saved successfully ({len(data_dicts)} row(s))")
         
     except Exception as e:
+        _reset_on_auth_error(e)
         print(f"❌ Save failed: {str(e)}")
-        raise Exception(f"Sheets Write Error: {str(e)}")
+        raise Exception(f"Sheets Write Error: {str(e)}") from e
 
-def load_data(spreadsheet_id=None):
-    """Load all data as DataFrame."""
+@with_retry
+def load_data(spreadsheet_id=None, ranges=None):
+    """
+    Load all data as DataFrame using a single get_all_values() call.
+    Skips gspread's per-row dict building; all cells are returned as strings.
+    If `ranges` is given, returns a list of DataFrames via load_ranges() instead.
+    """
+    if ranges:
+        return load_ranges(ranges, spreadsheet_id)
     try:
-        credentials = get_credentials()
-        gc = gspread.authorize(credentials)
-        
         if spreadsheet_id is None:
             config = get_config()
             spreadsheet_id = config['spreadsheet_id']
             if not spreadsheet_id:
                 raise ValueError("Missing spreadsheet_id")
         
-        sh = gc.open_by_key(spreadsheet_id)
-        worksheet = sh.sheet1
+        worksheet = _get_worksheet(spreadsheet_id)
         
-        records = worksheet.get_all_records()
-        df = pd.DataFrame(records)
+        values = worksheet.get_all_values()
+        if not values:
+            return pd.DataFrame()
+        df = pd.DataFrame(values[1:], columns=values[0])
         
         print(f"✅ Data loaded: {len(df)} rows")
         return df
         
     except Exception as e:
+        _reset_on_auth_error(e)
         print(f"❌ Load failed: {str(e)}")
-        raise Exception(f"Sheets Read Error: {str(e)}")
+        raise Exception(f"Sheets Read Error: {str(e)}") from e
 
-def append_data_to_sheet(data_row, spreadsheet_id=None):
-    """Append a raw list as a row."""
+@with_retry
+def load_ranges(ranges, spreadsheet_id=None):
+    """
+    Load several A1 ranges (e.g. "Sheet1!A1:D", "Arkib!A:C") in one values.batchGet call.
+    Returns one DataFrame per range, using each range's first row as header.
+    """
     try:
         if spreadsheet_id is None:
             config = get_config()
             spreadsheet_id = config['spreadsheet_id']
-            
-        credentials = get_credentials()
-        gc = gspread.authorize(credentials)
+            if not spreadsheet_id:
+                raise ValueError("Missing spreadsheet_id")
+        
+        sh = _get_worksheet(spreadsheet_id).spreadsheet
+        response = sh.values_batch_get(
+            ranges=list(ranges),
+            params={'valueRenderOption': 'UNFORMATTED_VALUE'}
+        )
+        
+        frames = []
+        for value_range in response.get('valueRanges', []):
+            values = value_range.get('values', [])
+            if not values:
+                frames.append(pd.DataFrame())
+                continue
+            header = values[0]
+            # The API trims trailing empty cells, so pad/cut rows to the header width
+            rows = [(r + [''] * len(header))[:len(header)] for r in values[1:]]
+            frames.append(pd.DataFrame(rows, columns=header))
         
-        sh = gc.open_by_key(spreadsheet_id)
-        worksheet = sh.sheet1
+        print(f"✅ Ranges loaded: {len(frames)}")
+        return frames
         
-        worksheet.append_row(data_row)
-        print(f"✅ Row appended: {data_row}")
+    except Exception as e:
+        _reset_on_auth_error(e)
+        print(f"❌ Load failed: {str(e)}")
+        raise Exception(f"Sheets Read Error: {str(e)}") from e
+
+@with_retry(idempotent=False)
+def append_rows_to_sheet(rows, spreadsheet_id=None, value_input_option='USER_ENTERED'):
+    """Append a list of lists in a single values.append call."""
+    try:
+        if spreadsheet_id is None:
+            config = get_config()
+            spreadsheet_id = config['spreadsheet_id']
+            
+        worksheet = _get_worksheet(spreadsheet_id)
+        
+        worksheet.append_rows(
+            [list(r) for r in rows],
+            value_input_option=value_input_option,
+            insert_data_option='INSERT_ROWS'
+        )
+        print(f"✅ {len(rows)} row(s) appended")
         return True
         
     except Exception as e:
+        _reset_on_auth_error(e)
         print(f"❌ Append failed: {str(e)}")
-        raise Exception(f"Sheets Append Error: {str(e)}")
+        raise Exception(f"Sheets Append Error: {str(e)}") from e
+
+def append_data_to_sheet(data_row, spreadsheet_id=None):
+    """Append a raw list (or a list of lists) as row(s) in a single API call."""
+    rows = data_row if data_row and isinstance(data_row[0], (list, tuple)) else [data_row]
+    return append_rows_to_sheet(rows, spreadsheet_id, value_input_option='RAW')
+
+def _schedule_flush():
+    """Start the flush timer if none is pending. Caller must hold _pending_lock."""
+    global _flush_timer
+    if _flush_timer is None:
+        _flush_timer = threading.Timer(APPEND_FLUSH_INTERVAL, flush_pending_rows)
+        _flush_timer.daemon = True
+        _flush_timer.start()
+
+def queue_row_for_sheet(data_row, spreadsheet_id=None):
+    """
+    Buffer a row for a batched append instead of writing it immediately.
+    Returns a Future that resolves once the row is in the sheet, or raises the
+    flush error; callers must wait on it before reporting success.
+    A row that arrives while nothing else is pending or being flushed is written
+    straight away (on a background thread); otherwise it joins the next timer /
+    size-triggered batch.
+    """
+    if spreadsheet_id is None:
+        config = get_config()
+        spreadsheet_id = config['spreadsheet_id']
+        
+    saved = Future()
+    with _pending_lock:
+        _pending_rows.setdefault(spreadsheet_id, []).append((list(data_row), saved, 0))
+        pending = sum(len(rows) for rows in _pending_rows.values())
+        flush_now = pending >= APPEND_FLUSH_MAX_ROWS or (pending == 1 and _flushes_running == 0)
+        if not flush_now:
+            _schedule_flush()
+            
+    if flush_now:
+        # Flushed off the caller's thread so callers can bound their wait on the Future
+        threading.Thread(target=flush_pending_rows).start()
+    return saved
+
+def flush_pending_rows():
+    """
+    Write all buffered rows, one append call per spreadsheet.
+    Rate-limited batches are re-queued (up to APPEND_FLUSH_MAX_ATTEMPTS);
+    any other error is raised to every waiting caller instead.
+    """
+    global _flush_timer, _flushes_running
+    with _pending_lock:
+        if _flush_timer is not None:
+            _flush_timer.cancel()
+            _flush_timer = None
+        batches = dict(_pending_rows)
+        _pending_rows.clear()
+        _flushes_running += 1
+        
+    try:
+        for spreadsheet_id, entries in batches.items():
+            try:
+                append_data_to_sheet([row for row, _, _ in entries], spreadsheet_id)
+            except Exception as e:
+                # Appends are not idempotent: only a rejected (rate-limited) batch is safe to resend
+                transient, _ = _transient_error_info(e, idempotent=False)
+                retry = [(row, fut, n + 1) for row, fut, n in entries
+                         if transient and n + 1 < APPEND_FLUSH_MAX_ATTEMPTS]
+                if retry:
+                    print(f"⚠️ Flush rate-limited, re-queueing {len(retry)} row(s): {str(e)}")
+                    with _pending_lock:
+                        _pending_rows.setdefault(spreadsheet_id, [])[:0] = retry
+                        _schedule_flush()
+                else:
+                    print(f"❌ Flush failed, {len(entries)} row(s) not saved: {str(e)}")
+                    for _, fut, _ in entries:
+                        fut.set_exception(e)
+                continue
+            for _, fut, _ in entries:
+                fut.set_result(True)
+    finally:
+        with _pending_lock:
+            _flushes_running -= 1
+
+atexit.register(flush_pending_rows)
+
+@with_retry
+def ensure_header_column(col, name, spreadsheet_id=None):
+    """
+    Make sure header cell `col` (1-based) exists, writing `name` there if the
+    header row is shorter. Used when a new trailing column is introduced.
+    Checked once per process per sheet (via the header cache).
+    """
+    try:
+        if spreadsheet_id is None:
+            config = get_config()
+            spreadsheet_id = config['spreadsheet_id']
+            
+        headers = _header_cache.get(spreadsheet_id)
+        if headers is not None and len(headers) >= col:
+            return
+        worksheet = _get_worksheet(spreadsheet_id)
+        headers = worksheet.row_values(1)
+        if headers and len(headers) < col:
+            worksheet.update_cell(1, col, name)
+            headers = headers + [''] * (col - 1 - len(headers)) + [name]
+            print(f"✅ Header column added: {name}")
+        if headers:
+            _header_cache[spreadsheet_id] = headers
+    except Exception as e:
+        _reset_on_auth_error(e)
+        print(f"❌ Header check failed: {str(e)}")
+        raise Exception(f"Sheets Header Error: {str(e)}") from e
 
 def read_all_data(spreadsheet_id=None):
     """Alias for load_data logic but returns DataFrame."""
     return load_data(spreadsheet_id)
 
+@with_retry
 def update_sheet(dataframe, spreadsheet_id=None):
     """Update entire sheet with DataFrame content."""
     try:
@@ -189,22 +581,121 @@ def update_sheet(dataframe, spreadsheet_id=None):
             config = get_config()
             spreadsheet_id = config['spreadsheet_id']
             
-        credentials = get_credentials()
-        gc = gspread.authorize(credentials)
-        
-        sh = gc.open_by_key(spreadsheet_id)
-        worksheet = sh.sheet1
+        worksheet = _get_worksheet(spreadsheet_id)
         
         # Prepare data: Header + Rows
-        data = [dataframe.columns.values.tolist()] + dataframe.values.tolist()
+        data = [dataframe.columns.values.tolist()] + [
+            [_to_cell(v) for v in row] for row in dataframe.values.tolist()
+        ]
         
-        worksheet.clear()
-        worksheet.update(data)
+        # One spreadsheets.batchUpdate: updateCells over the whole (unbounded) sheet
+        # writes the data and clears every other value, below and to the right,
+        # while keeping formatting; the sheet is never momentarily empty
+        width = max(len(data[0]), 1)
+        # Current grid size is read fresh: the memoized worksheet's row_count
+        # goes stale as soon as rows are appended
+        metadata = worksheet.spreadsheet.fetch_sheet_metadata(
+            {'fields': 'sheets.properties(sheetId,gridProperties(rowCount,columnCount))'}
+        )
+        grid = next(
+            s['properties'].get('gridProperties', {}) for s in metadata['sheets']
+            if s['properties']['sheetId'] == worksheet.id
+        )
+        requests = []
+        extra_rows = len(data) - grid.get('rowCount', 0)
+        extra_cols = width - grid.get('columnCount', 0)
+        if extra_rows > 0:
+            requests.append({'appendDimension': {'sheetId': worksheet.id, 'dimension': 'ROWS', 'length': extra_rows}})
+        if extra_cols > 0:
+            requests.append({'appendDimension': {'sheetId': worksheet.id, 'dimension': 'COLUMNS', 'length': extra_cols}})
+        requests.append({'updateCells': {
+            'range': {'sheetId': worksheet.id},
+            'rows': [{'values': [_cell_data(v) for v in row]} for row in data],
+            'fields': 'userEnteredValue'
+        }})
+        worksheet.spreadsheet.batch_update({'requests': requests})
+        _header_cache[spreadsheet_id] = data[0]
         print("✅ Sheet updated successfully")
         return True
     except Exception as e:
+        _reset_on_auth_error(e)
+        print(f"❌ Update failed: {str(e)}")
+        raise Exception(f"Sheet Update Error: {str(e)}") from e
+
+def _to_cell(value):
+    """Convert pandas/numpy scalars to JSON-safe cell values."""
+    if pd.isna(value):
+        return ''
+    return value.item() if hasattr(value, 'item') else value
+
+def _cell_data(value):
+    """Convert a cell value to a CellData dict (RAW semantics: strings are never parsed)."""
+    if value == '' or value is None:
+        return {}  # empty CellData clears the cell
+    if isinstance(value, bool):
+        return {'userEnteredValue': {'boolValue': value}}
+    if isinstance(value, (int, float)):
+        return {'userEnteredValue': {'numberValue': value}}
+    return {'userEnteredValue': {'stringValue': str(value)}}
+
+def update_sheet_cells(cell_updates, deleted_rows=(), spreadsheet_id=None):
+    """
+    Write only changed cells and delete rows, instead of rewriting the whole sheet.
+    
+    Args:
+        cell_updates: iterable of (row, col, value) using 1-based sheet coordinates
+        deleted_rows: 1-based sheet row numbers to remove
+    """
+    try:
+        if spreadsheet_id is None:
+            config = get_config()
+            spreadsheet_id = config['spreadsheet_id']
+            
+        worksheet = _get_worksheet(spreadsheet_id)
+        
+        # Group horizontally contiguous cells of the same row into one A1 range
+        by_row = {}
+        for row, col, value in cell_updates:
+            by_row.setdefault(row, []).append((col, _to_cell(value)))
+            
+        data = []
+        for row, cells in sorted(by_row.items()):
+            cells.sort(key=lambda cell: cell[0])
+            runs = [[cells[0]]]
+            for cell in cells[1:]:
+                if cell[0] == runs[-1][-1][0] + 1:
+                    runs[-1].append(cell)
+                else:
+                    runs.append([cell])
+            for run in runs:
+                start = gspread.utils.rowcol_to_a1(row, run[0][0])
+                end = gspread.utils.rowcol_to_a1(row, run[-1][0])
+                data.append({'range': f"{start}:{end}", 'values': [[v for _, v in run]]})
+        
+        # One values.batchUpdate call for all edits (overwrites: safe to retry)
+        if data:
+            with_retry(worksheet.batch_update)(data, value_input_option='RAW')
+            
+        # One spreadsheets.batchUpdate call for all deletions (bottom-up so row numbers stay valid)
+        if deleted_rows:
+            requests = [
+                {'deleteDimension': {'range': {
+                    'sheetId': worksheet.id,
+                    'dimension': 'ROWS',
+                    'startIndex': row - 1,
+                    'endIndex': row
+                }}}
+                for row in sorted(set(deleted_rows), reverse=True)
+            ]
+            # Retried on rate limits only: repeating an applied deletion would remove other rows
+            with_retry(worksheet.spreadsheet.batch_update, idempotent=False)({'requests': requests})
+            
+        print(f"✅ Sheet updated: {len(data)} range(s), {len(set(deleted_rows))} row(s) deleted")
+        return True
+    except Exception as e:
+        _reset_on_auth_error(e)
         print(f"❌ Update failed: {str(e)}")
-        raise Exception(f"Sheet Update Error: {str(e)}")
+        raise Exception(f"Sheet Update Error: {str(e)}") from e
 
 if __name__ == "__main__":
     print("Connection module loaded.")
@@ -4,40 +4,110 @@ Google Drive Handler Module
 """
 
 import io
+import mimetypes
+import threading
 from datetime import datetime
+import httplib2
+import google_auth_httplib2
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
 from googleapiclient.http import MediaIoBaseUpload
-from connection import get_credentials
+from connection import cached_credentials, refresh_credentials, with_retry
 
-def upload_to_drive(file, folder_id, filename=None):
+# 分块上传大小（断点续传模式，必须是 256 KB 的倍数）
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+# 单个分块遇到 5xx/429 时的重试次数（只重传该分块，不必整个文件重来）
+UPLOAD_CHUNK_RETRIES = 3
+
+_credentials = None
+_service = None
+_service_lock = threading.Lock()
+_thread_local = threading.local()
+
+def _get_service():
+    """
+    获取共享的 Drive service（进程内只构建一次，避免每次调用都重新 build）
+    使用库内置的静态 discovery 文档，构建时不需要额外的网络请求
+    """
+    global _credentials, _service
+    with _service_lock:
+        if _service is None:
+            _credentials = cached_credentials()  # 与 Sheets 客户端共用同一份凭证
+            _service = build('drive', 'v3', credentials=_credentials,
+                             cache_discovery=False, static_discovery=True)
+    return _service
+
+def _get_http():
+    """
+    获取当前线程的已授权 Http 对象
+    httplib2 不是线程安全的，并发上传时每个线程使用独立的连接（线程内复用）
+    """
+    http = getattr(_thread_local, 'http', None)
+    if http is None:
+        _get_service()
+        http = google_auth_httplib2.AuthorizedHttp(_credentials, http=httplib2.Http())
+        _thread_local.http = http
+    return http
+
+def get_drive_service():
+    """
+    获取共享的 Drive service（供测试脚本等模块外部调用）
+    
+    Returns:
+        Resource: Drive v3 service
     """
-    上传文件到 Google Drive
+    return _get_service()
+
+def get_drive_http():
+    """
+    获取当前线程复用的已授权 Http 对象（供测试脚本等模块外部调用）
+    
+    Returns:
+        AuthorizedHttp: 当前线程的已授权连接
+    """
+    return _get_http()
+
+def _reset_on_auth_error(e):
+    """
+    遇到 401 时强制刷新共享凭证的令牌
+    service 和各线程的 Http 对象持有同一个凭证对象，刷新后下次调用即使用新令牌
     
     Args:
-        file: 文件对象（可以是 Streamlit UploadedFile 或 BytesIO）
+        e: 捕获到的异常
+    """
+    if isinstance(e, HttpError) and e.resp.status == 401:
+        try:
+            refresh_credentials()
+        except Exception as refresh_error:
+            print(f"⚠️ 401 后刷新令牌失败: {str(refresh_error)}")
+
+@with_retry(idempotent=False)
+def upload_file(file, folder_id, filename=None):
+    """
+    上传文件到 Google Drive（不设置共享权限）
+    
+    Args:
+        file: 文件对象（可以是 Streamlit UploadedFile、BytesIO 或 bytes）
         folder_id: 目标文件夹 ID
         filename: 可选的文件名（如果 file 没有 name 属性）
     
     Returns:
-        str: 可分享的文件链接
+        dict: {'id': 文件 ID, 'webViewLink': 文件链接}
     """
     try:
-        credentials = get_credentials()
-        service = build('drive', 'v3', credentials=credentials)
+        service = _get_service()
+        http = _get_http()
         
         # 获取文件名
         if filename is None:
             filename = getattr(file, 'name', f'upload_{datetime.now().strftime("%Y%m%d_%H%M%S")}')
         
-        # 准备文件内容
-        if hasattr(file, 'read'):
-            file_content = file.read()
-            if hasattr(file, 'seek'):
-                file.seek(0)  # 重置文件指针
+        # 准备文件流：文件对象直接流式上传，不再 read() 复制一份
+        if hasattr(file, 'seek'):
+            file.seek(0)  # 重置文件指针（重试时从头开始）
+            file_stream = file
         else:
-            file_content = file
-        
-        file_stream = io.BytesIO(file_content)
+            file_stream = io.BytesIO(file)  # bytes（BytesIO 与原 bytes 共享缓冲区）
         
         # 文件元数据
         file_metadata = {
@@ -45,40 +115,83 @@ def upload_to_drive(file, folder_id, filename=None):
             'parents': [folder_id]
         }
         
-        # 上传文件（小文件使用非断点续传模式更稳定）
+        # 上传文件（断点续传 + 分块，逐块发送）
         media = MediaIoBaseUpload(
             file_stream,
-            mimetype='application/octet-stream',
-            resumable=False
+            mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream',
+            chunksize=UPLOAD_CHUNK_SIZE,
+            resumable=True
         )
         
-        uploaded_file = service.files().create(
+        request = service.files().create(
             body=file_metadata,
             media_body=media,
             fields='id, webViewLink',
             supportsAllDrives=True,
             supportsTeamDrives=True  # 旧版兼容性，对 Service Account 依然有效
-        ).execute()
+        )
+        uploaded_file = None
+        while uploaded_file is None:
+            _, uploaded_file = request.next_chunk(http=http, num_retries=UPLOAD_CHUNK_RETRIES)
         
-        # 设置文件为公开可访问
-        try:
-            service.permissions().create(
-                fileId=uploaded_file['id'],
-                body={'type': 'anyone', 'role': 'reader'},
-                supportsAllDrives=True
-            ).execute()
-            print(f"✅ 文件已设为公开访问")
-        except Exception as e:
-            print(f"⚠️ 设置公开访问失败: {str(e)}")
-        
-        link = uploaded_file.get('webViewLink')
         print(f"✅ 文件上传成功: {filename}")
-        return link
+        return uploaded_file
         
     except Exception as e:
+        _reset_on_auth_error(e)
         print(f"❌ 上传文件失败: {str(e)}")
-        raise Exception(f"Drive 上传失败: {str(e)}")
+        raise Exception(f"Drive 上传失败: {str(e)}") from e
 
+def share_publicly(file_ids):
+    """
+    将多个文件设为公开可访问（所有 permissions.create 合并为一个 batch HTTP 请求）
+    设置失败只打印警告，不影响上传结果
+    
+    Args:
+        file_ids: 文件 ID 列表
+    """
+    if not file_ids:
+        return
+    
+    def on_response(request_id, response, exception):
+        if exception is not None:
+            print(f"⚠️ 设置公开访问失败 ({request_id}): {str(exception)}")
+    
+    try:
+        service = _get_service()
+        batch = service.new_batch_http_request(callback=on_response)
+        for file_id in file_ids:
+            batch.add(
+                service.permissions().create(
+                    fileId=file_id,
+                    body={'type': 'anyone', 'role': 'reader'},
+                    supportsAllDrives=True
+                ),
+                request_id=file_id
+            )
+        batch.execute(http=_get_http())
+        print(f"✅ {len(file_ids)} 个文件已设为公开访问")
+    except Exception as e:
+        _reset_on_auth_error(e)
+        print(f"⚠️ 设置公开访问失败: {str(e)}")
+
+def upload_to_drive(file, folder_id, filename=None):
+    """
+    上传文件到 Google Drive 并设为公开访问
+    
+    Args:
+        file: 文件对象（可以是 Streamlit UploadedFile、BytesIO 或 bytes）
+        folder_id: 目标文件夹 ID
+        filename: 可选的文件名（如果 file 没有 name 属性）
+    
+    Returns:
+        str: 可分享的文件链接
+    """
+    uploaded_file = upload_file(file, folder_id, filename)
+    share_publicly([uploaded_file['id']])
+    return uploaded_file.get('webViewLink')
+
+@with_retry(idempotent=False)
 def create_folder(folder_name, parent_id):
     """
     在指定父文件夹下创建新文件夹
@@ -91,8 +204,7 @@ def create_folder(folder_name, parent_id):
         str: 新文件夹的 ID
     """
     try:
-        credentials = get_credentials()
-        service = build('drive', 'v3', credentials=credentials)
+        service = _get_service()
         
         file_metadata = {
             'name': folder_name,
@@ -105,12 +217,40 @@ def create_folder(folder_name, parent_id):
             fields='id',
             supportsAllDrives=True,
             supportsTeamDrives=True
-        ).execute()
+        ).execute(http=_get_http())
         
         folder_id = folder.get('id')
         print(f"✅ 文件夹创建成功: {folder_name} (ID: {folder_id})")
         return folder_id
         
     except Exception as e:
+        _reset_on_auth_error(e)
         print(f"❌ 创建文件夹失败: {str(e)}")
-        raise Exception(f"Drive 创建文件夹失败: {str(e)}")
+        raise Exception(f"Drive 创建文件夹失败: {str(e)}") from e
+
+def get_modified_time(file_id):
+    """
+    获取文件的最后修改时间（只请求一个元数据字段，开销很小）
+    不做重试：调用方每次 rerun 都会请求，失败时应立即回退而不是阻塞退避
+    
+    Args:
+        file_id: 文件 ID（例如 Spreadsheet ID）
+        
+    Returns:
+        str: RFC 3339 格式的 modifiedTime
+    """
+    try:
+        service = _get_service()
+        
+        metadata = service.files().get(
+            fileId=file_id,
+            fields='modifiedTime',
+            supportsAllDrives=True
+        ).execute(http=_get_http())
+        
+        return metadata.get('modifiedTime')
+        
+    except Exception as e:
+        _reset_on_auth_error(e)
+        print(f"❌ 获取文件元数据失败: {str(e)}")
+        raise Exception(f"Drive 获取元数据失败: {str(e)}") from e
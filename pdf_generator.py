@@ -1,37 +1,83 @@
 import io
+import hashlib
+import mimetypes
+import zipfile
+import threading
 import requests
 import re
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.utils import ImageReader
 from reportlab.lib.units import mm
 from reportlab.lib import colors
-from pdfrw import PdfReader
+from PIL import Image
+from pdfrw import PdfArray, PdfDict, PdfReader
 from pdfrw.buildxobj import pagexobj
 from pdfrw.toreportlab import makerl
 
+try:
+    import pypdfium2 as pdfium
+except ImportError:  # optional: scanned PDFs fall back to form-XObject embedding
+    pdfium = None
+
 # ==============================================================================
 # 1. HELPER: NETWORK & FILE HANDLING
 # ==============================================================================
 
+DOWNLOAD_WORKERS = 8
+
+# Precompiled patterns (used for every attachment URL)
+_RE_DRIVE_FILE = re.compile(r'/file/d/([a-zA-Z0-9_-]+)')
+_RE_DRIVE_ID = re.compile(r'[?&]id=([a-zA-Z0-9_-]+)')
+_RE_URL_SPLIT = re.compile(r'[,\n]')
+
+# Shared session: keep-alive connections are reused across attachment downloads
+_SESSION = requests.Session()
+_SESSION.mount('https://', HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=16,
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504])
+))
+
 def extract_drive_id(url):
     """Extract File ID from various Google Drive URL formats."""
     if not url or not isinstance(url, str):
         return None
     
     # Pattern 1: /file/d/ID/view
-    match = re.search(r'/file/d/([a-zA-Z0-9_-]+)', url)
+    match = _RE_DRIVE_FILE.search(url)
     if match: return match.group(1)
     
     # Pattern 2: id=ID
-    match = re.search(r'[?&]id=([a-zA-Z0-9_-]+)', url)
+    match = _RE_DRIVE_ID.search(url)
     if match: return match.group(1)
     
     return None
 
+# Magic bytes -> canonical content type
+_MAGIC_TYPES = (
+    (b'%PDF', 'application/pdf'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+)
+
+def sniff_content_type(content):
+    """Return the content type implied by the leading bytes, or None."""
+    head = content[:8]
+    for magic, ctype in _MAGIC_TYPES:
+        if head.startswith(magic):
+            return ctype
+    return None
+
 def download_file(url):
     """
     Robust file downloader.
+    The content type is taken from the file's magic bytes when recognised,
+    since Drive often reports application/octet-stream or text/html.
     Returns: (bytes_content, content_type) or (None, None)
     """
     if not url or len(str(url)) < 5:
@@ -43,33 +89,170 @@ def download_file(url):
         target_url = f"https://drive.google.com/uc?export=download&id={file_id}"
         
     try:
-        response = requests.get(target_url, timeout=15)
+        response = _SESSION.get(target_url, timeout=15)
         if response.status_code == 200:
-            return response.content, response.headers.get('Content-Type', '')
+            content = response.content
+            ctype = sniff_content_type(content)
+            if ctype is None and file_id and 'text/html' in response.headers.get('Content-Type', ''):
+                # Drive's virus-scan interstitial: confirm and fetch the real file
+                response = _SESSION.get(target_url + "&confirm=t", timeout=15)
+                if response.status_code != 200:
+                    return None, None
+                content = response.content
+                ctype = sniff_content_type(content)
+            return content, ctype or response.headers.get('Content-Type', '')
     except Exception as e:
         pass
         
     return None, None
 
+# Archive-mode submissions store every attachment in one ZIP (Arkib_Link);
+# members are addressed as "arkib:<member name>" alongside normal URLs
+ARCHIVE_PREFIX = 'arkib:'
+
+def extract_archive(zip_bytes):
+    """
+    Return {member name: (bytes_content, content_type)} for a submission archive,
+    or {} if it cannot be read.
+    """
+    members = {}
+    try:
+        with zipfile.ZipFile(io.BytesIO(zip_bytes)) as z:
+            for name in z.namelist():
+                if name.endswith('/'):
+                    continue
+                content = z.read(name)
+                ctype = sniff_content_type(content) or mimetypes.guess_type(name)[0] or ''
+                members[name] = (content, ctype)
+    except Exception as e:
+        pass
+    return members
+
 # ==============================================================================
 # 2. HELPER: RENDERING
 # ==============================================================================
 
+# Parsed PDFs keyed by content hash: repeated attachments skip pdfrw parsing.
+# Only the page xobjects are cached; makerl() output is canvas-specific.
+# Bounded by total source bytes first (scans can be several MB each), entry count
+# second; a PDF larger than the whole byte budget is parsed but not kept.
+PDF_CACHE_MAX_BYTES = 64 * 1024 * 1024
+PDF_CACHE_SIZE = 16
+_pdf_cache = OrderedDict()  # digest -> (PdfReader, {page_idx: pagexobj}, source size)
+_pdf_cache_bytes = 0
+_pdf_cache_lock = threading.Lock()
+
+def _get_pdf_entry(pdf_bytes):
+    """
+    Return the cached (PdfReader, {page_idx: pagexobj}) entry for a PDF bytes object.
+    Each distinct PDF is parsed once (LRU within PDF_CACHE_MAX_BYTES of source and
+    PDF_CACHE_SIZE entries) and fully loaded, so cached readers are read-only and
+    safe to share across threads.
+    """
+    global _pdf_cache_bytes
+    key = hashlib.blake2b(pdf_bytes, digest_size=16).digest()
+    with _pdf_cache_lock:
+        cached = _pdf_cache.get(key)
+        if cached is not None:
+            _pdf_cache.move_to_end(key)
+            return cached[:2]
+            
+    # Parse straight from the downloaded bytes (no BytesIO copy)
+    reader = PdfReader(fdata=pdf_bytes)
+    # Load every indirect object before sharing the reader: pdfrw loads them
+    # lazily through one tokenizer position, which concurrent makerl()/doForm()
+    # calls from other sessions would otherwise race on
+    reader.read_all()
+    entry = (reader, {})
+    size = len(pdf_bytes)
+    with _pdf_cache_lock:
+        if key in _pdf_cache:
+            return _pdf_cache[key][:2]  # parsed concurrently by another session
+        _pdf_cache[key] = entry + (size,)
+        _pdf_cache_bytes += size
+        while _pdf_cache and (
+            _pdf_cache_bytes > PDF_CACHE_MAX_BYTES or len(_pdf_cache) > PDF_CACHE_SIZE
+        ):
+            _, (_, _, evicted) = _pdf_cache.popitem(last=False)
+            _pdf_cache_bytes -= evicted
+    return entry
+
+def get_page_count(pdf_bytes):
+    """Return the number of pages in a PDF bytes object (uses the parse cache)."""
+    reader, _ = _get_pdf_entry(pdf_bytes)
+    return len(reader.pages)
+
+def get_page_xobj(pdf_bytes, page_idx=0):
+    """
+    Return (page, page_xobj) for a page of a PDF bytes object, or (None, None).
+    """
+    reader, xobjs = _get_pdf_entry(pdf_bytes)
+    if page_idx >= len(reader.pages):
+        return None, None
+        
+    with _pdf_cache_lock:
+        if page_idx not in xobjs:
+            xobjs[page_idx] = pagexobj(reader.pages[page_idx])
+        return reader.pages[page_idx], xobjs[page_idx]
+
+RASTER_SCALE = 2  # 144 DPI when rasterizing scanned pages
+RASTER_JPEG_QUALITY = 85
+# PDFium is not thread-safe: every pypdfium2 call goes through this lock
+_PDFIUM_LOCK = threading.Lock()
+
+def is_scanned_page(page):
+    """
+    Quick heuristic: the page draws a single Image XObject and has no fonts,
+    i.e. it is a scan wrapped in a PDF rather than vector/text content.
+    """
+    resources = page.inheritable.Resources
+    if not resources or resources.Font:
+        return False
+    xobjects = resources.XObject or {}
+    subtypes = [xobj.Subtype for xobj in xobjects.values()]
+    return subtypes == ['/Image']
+
+def rasterize_pdf_page(pdf_bytes, page_idx=0):
+    """
+    Rasterize one page with pypdfium2 and return JPEG bytes, or None.
+    """
+    if pdfium is None:
+        return None
+    try:
+        with _PDFIUM_LOCK:
+            doc = pdfium.PdfDocument(pdf_bytes)
+            try:
+                page = doc[page_idx]
+                bitmap = page.render(scale=RASTER_SCALE)
+                # copy() detaches the image from the PDFium buffer; page and bitmap
+                # are closed here rather than by a finalizer outside the lock
+                image = bitmap.to_pil().copy()
+                bitmap.close()
+                page.close()
+            finally:
+                doc.close()
+        buf = io.BytesIO()
+        image.convert('RGB').save(buf, 'JPEG', quality=RASTER_JPEG_QUALITY)
+        return buf.getvalue()
+    except Exception as e:
+        return None
+
 def render_pdf_page(c, pdf_bytes, page_idx=0):
     """
     Render a specific page from a PDF bytes object onto the ReportLab canvas.
     Scales to fit A4 while preserving aspect ratio.
+    Scanned (image-only) pages are rasterized and drawn as a JPEG instead,
+    which is smaller than shipping the whole page stream as a form XObject.
     """
     try:
-        # Wrap bytes in BytesIO for pdfrw
-        pdf_file = io.BytesIO(pdf_bytes)
-        reader = PdfReader(pdf_file)
-        
-        if page_idx >= len(reader.pages):
+        page, page_obj = get_page_xobj(pdf_bytes, page_idx)
+        if page is None:
             return False
-            
-        page = reader.pages[page_idx]
-        page_obj = pagexobj(page)
+        
+        if pdfium is not None and is_scanned_page(page):
+            jpeg = rasterize_pdf_page(pdf_bytes, page_idx)
+            if jpeg and render_image(c, jpeg):
+                return True
         
         # Get page bounding box
         # page.MediaBox is usually [x, y, w, h]
@@ -100,6 +283,10 @@ def render_pdf_page(c, pdf_bytes, page_idx=0):
         c.translate(pos_x, pos_y)
         c.scale(scale, scale)
         c.doForm(makerl(c, page_obj))
+        # Remember cached xobjects drawn on this canvas (see release_canvas_refs)
+        if not hasattr(c, '_pdfrw_xobjs'):
+            c._pdfrw_xobjs = []
+        c._pdfrw_xobjs.append(page_obj)
         c.restoreState()
         return True
         
@@ -107,6 +294,79 @@ def render_pdf_page(c, pdf_bytes, page_idx=0):
         return False
         return False
 
+def release_canvas_refs(c):
+    """
+    Drop the ReportLab objects makerl() stored on cached pdfrw objects for this canvas.
+    makerl() memoizes per document in obj.derived_rl_obj[rldoc]; without this every
+    report drawn from a cached xobject (with all its images) would stay referenced.
+    """
+    rldoc = c._doc
+    stack = list(getattr(c, '_pdfrw_xobjs', ()))
+    seen = set()
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        docdict = getattr(obj, 'derived_rl_obj', None)
+        if not docdict or docdict.pop(rldoc, None) is None:
+            continue  # not converted for this canvas, so neither were its children
+        if isinstance(obj, PdfDict):
+            stack.extend(value for _, value in obj.iteritems())
+        elif isinstance(obj, PdfArray):
+            stack.extend(obj)
+    c._pdfrw_xobjs = []
+
+def render_pdf_all_pages(c, pdf_bytes, draw_header=None):
+    """
+    Render every page of a PDF bytes object, one canvas page each.
+    The PDF is parsed once; c.showPage() is called between pages (not after the last).
+    draw_header(c, page_no) is called before each page after the first.
+    Returns True if at least one page was rendered.
+    """
+    try:
+        n_pages = get_page_count(pdf_bytes)
+    except Exception as e:
+        return False
+    
+    rendered = False
+    for page_idx in range(n_pages):
+        if page_idx > 0:
+            c.showPage()
+            if draw_header:
+                draw_header(c, page_idx + 1)
+        rendered = render_pdf_page(c, pdf_bytes, page_idx) or rendered
+    return rendered
+
+EMBED_DPI = 300
+EMBED_JPEG_QUALITY = 82
+
+def downsample_image(img_bytes, dw, dh):
+    """
+    Re-encode an image to at most EMBED_DPI at its drawn size (dw x dh points).
+    Returns JPEG bytes, or the original bytes if already small enough
+    (or on any decode error). Re-encoding also strips EXIF.
+    """
+    try:
+        target = (max(1, int(dw / mm * EMBED_DPI / 25.4)), max(1, int(dh / mm * EMBED_DPI / 25.4)))
+        im = Image.open(io.BytesIO(img_bytes))
+        if im.width <= target[0] and im.height <= target[1]:
+            return img_bytes
+        im.thumbnail(target, Image.LANCZOS)
+        if im.mode in ('RGBA', 'LA', 'P'):
+            # JPEG has no alpha: flatten transparent areas onto white
+            im = im.convert('RGBA')
+            bg = Image.new('RGB', im.size, (255, 255, 255))
+            bg.paste(im, mask=im.split()[-1])
+            im = bg
+        elif im.mode != 'RGB':
+            im = im.convert('RGB')
+        buf = io.BytesIO()
+        im.save(buf, 'JPEG', quality=EMBED_JPEG_QUALITY, optimize=True)
+        return buf.getvalue()
+    except Exception as e:
+        return img_bytes
+
 def render_image(c, img_bytes, max_h=None):
     """
     Render image bytes onto canvas.
@@ -131,6 +391,11 @@ def render_image(c, img_bytes, max_h=None):
         # For full page centering (Sijil/Surat)
         y = (page_h - dh) / 2
         
+        # Embed at print resolution instead of the full camera resolution
+        small = downsample_image(img_bytes, dw, dh)
+        if small is not img_bytes:
+            img = ImageReader(io.BytesIO(small))
+        
         c.drawImage(img, x, y, width=dw, height=dh)
         return True
     except Exception as e:
@@ -146,7 +411,19 @@ def generate_pdf(data_dict):
     Generate PDF with fix data mapping and mixed content support.
     """
     buffer = io.BytesIO()
-    c = canvas.Canvas(buffer, pagesize=A4)
+    # Flate-compress page streams: smaller download over the Streamlit websocket
+    c = canvas.Canvas(buffer, pagesize=A4, pageCompression=1)
+    try:
+        _draw_report(c, data_dict)
+        c.save()
+    finally:
+        # Also on failure: cached xobjects must not keep this document alive
+        release_canvas_refs(c)
+    buffer.seek(0)
+    return buffer
+
+def _draw_report(c, data_dict):
+    """Draw every page of the report onto canvas c (does not save it)."""
     width, height = A4
     margin = 25*mm
     
@@ -181,6 +458,62 @@ def generate_pdf(data_dict):
     peringkat = get_val(['Peringkat'])
     pencapaian = get_val(['Pencapaian'])
 
+    # -------------------------------------------------------------------------
+    # PART 2: ATTACHMENTS (downloaded concurrently before rendering)
+    # -------------------------------------------------------------------------
+    # Mapped Correctly to 'Sijil_Link' / 'Surat_Link'
+    sijil_url = get_val(['Sijil_Link', 'Sijil'], default=None)
+    if not (sijil_url and len(sijil_url) > 5):
+        sijil_url = None
+        
+    surat_url = get_val(['Surat_Link', 'Surat Jemputan'], default=None)
+    surat_urls = []
+    if surat_url and len(surat_url) > 5:
+        # If there are multiple links separated by comma or newlines
+        surat_urls = [u.strip() for u in _RE_URL_SPLIT.split(surat_url) if len(u.strip()) > 5]
+        
+    # Collect all image inputs from specific columns
+    img_urls = []
+    # Explicitly check Link_Foto1 to Link_Foto4
+    target_cols = ['Link_Foto1', 'Link_Foto2', 'Link_Foto3', 'Link_Foto4']
+    
+    for col in target_cols:
+        val = data_dict.get(col)
+        if val and isinstance(val, str) and len(val.strip()) > 5:
+            img_urls.append(val.strip())
+    
+    # Archive mode: attachments without their own link are read from the ZIP
+    # (members are named <timestamp>_Sijil.ext, _Surat.ext, _Gambar_N.ext)
+    archive = {}
+    arkib_url = get_val(['Arkib_Link'], default=None)
+    if arkib_url and len(arkib_url) > 5:
+        zip_bytes, _ = download_file(arkib_url)
+        archive = extract_archive(zip_bytes) if zip_bytes else {}
+        photo_links = bool(img_urls)
+        for name in sorted(archive):
+            stem = name.rsplit('.', 1)[0]
+            key = ARCHIVE_PREFIX + name
+            if stem.endswith('_Sijil') and not sijil_url:
+                sijil_url = key
+            elif stem.endswith('_Surat') and not surat_url:
+                surat_urls.append(key)
+            elif '_Gambar_' in stem and not photo_links:
+                img_urls.append(key)
+    
+    # Downloads are independent network I/O: fetch them all at once
+    all_urls = ([sijil_url] if sijil_url else []) + surat_urls + img_urls
+    with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as ex:
+        downloads = {
+            url: ex.submit(download_file, url)
+            for url in dict.fromkeys(all_urls) if not url.startswith(ARCHIVE_PREFIX)
+        }
+    
+    def fetch(url):
+        """Return the prefetched (content, content_type) for url."""
+        if url.startswith(ARCHIVE_PREFIX):
+            return archive[url[len(ARCHIVE_PREFIX):]]
+        return downloads[url].result()
+
     # -------------------------------------------------------------------------
     # PAGE 1: INFO UTAMA
     # -------------------------------------------------------------------------
@@ -221,14 +554,11 @@ def generate_pdf(data_dict):
     # -------------------------------------------------------------------------
     # PAGE 2: SIJIL (Mixed Content)
     # -------------------------------------------------------------------------
-    # Mapped Correctly to 'Sijil_Link'
-    sijil_url = get_val(['Sijil_Link', 'Sijil'], default=None)
-    
-    if sijil_url and len(sijil_url) > 5:
+    if sijil_url:
         c.setFont("Helvetica-Bold", 14)
         c.drawString(margin, height - 20*mm, "SIJIL PENCAPAIAN")
         
-        content, ctype = download_file(sijil_url)
+        content, ctype = fetch(sijil_url)
         if content:
             if 'application/pdf' in ctype:
                 # Render PDF Page 1
@@ -248,23 +578,22 @@ def generate_pdf(data_dict):
     # -------------------------------------------------------------------------
     # PAGE 3+: SURAT (Multiple Possible)
     # -------------------------------------------------------------------------
-    # Mapped Correctly to 'Surat_Link'
-    surat_url = get_val(['Surat_Link', 'Surat Jemputan'], default=None)
-    
-    if surat_url and len(surat_url) > 5:
-        # If there are multiple links separated by comma or newlines
-        urls = [u.strip() for u in re.split(r'[,\n]', surat_url) if len(u.strip()) > 5]
-        
-        for idx, s_url in enumerate(urls):
+    if surat_urls:
+        for idx, s_url in enumerate(surat_urls):
             c.setFont("Helvetica-Bold", 14)
             title = "SURAT JEMPUTAN"
-            if len(urls) > 1: title += f" ({idx+1})"
+            if len(surat_urls) > 1: title += f" ({idx+1})"
             c.drawString(margin, height - 20*mm, title)
             
-            content, ctype = download_file(s_url)
+            content, ctype = fetch(s_url)
             if content:
                 if 'application/pdf' in ctype:
-                    render_pdf_page(c, content, 0)
+                    # Multi-page surat: embed every page, repeating the title
+                    def draw_header(c, page_no, title=title):
+                        c.setFont("Helvetica-Bold", 14)
+                        c.drawString(margin, height - 20*mm, f"{title} - m/s {page_no}")
+                    if not render_pdf_all_pages(c, content, draw_header):
+                        c.drawString(margin, height/2, "[Ralat Memaparkan PDF Surat]")
                 elif 'image' in ctype:
                     render_image(c, content)
                 else:
@@ -277,16 +606,6 @@ def generate_pdf(data_dict):
     # -------------------------------------------------------------------------
     # PAGE N: GAMBAR (Grid - Images Only)
     # -------------------------------------------------------------------------
-    # Collect all image inputs from specific columns
-    img_urls = []
-    # Explicitly check Link_Foto1 to Link_Foto4
-    target_cols = ['Link_Foto1', 'Link_Foto2', 'Link_Foto3', 'Link_Foto4']
-    
-    for col in target_cols:
-        val = data_dict.get(col)
-        if val and isinstance(val, str) and len(val.strip()) > 5:
-            img_urls.append(val.strip())
-            
     if img_urls:
         c.setFont("Helvetica-Bold", 14)
         c.drawString(margin, height - 20*mm, "LAMPIRAN: GAMBAR AKTIVITI")
@@ -298,8 +617,8 @@ def generate_pdf(data_dict):
         valid_img_count = 0
         
         for i, url in enumerate(img_urls):
-            # Download first to check type (Skip PDFs in Image Grid)
-            content, ctype = download_file(url)
+            # Check type first (Skip PDFs in Image Grid)
+            content, ctype = fetch(url)
             if not content or 'image' not in ctype:
                 continue
                 
@@ -335,6 +654,10 @@ def generate_pdf(data_dict):
                 final_x = x_pos + pad + (avail_w - dw)/2
                 final_y = y_pos + pad + (avail_h - dh)/2
                 
+                small = downsample_image(content, dw, dh)
+                if small is not content:
+                    img = ImageReader(io.BytesIO(small))
+                
                 c.drawImage(img, final_x, final_y, width=dw, height=dh)
                 
             except Exception as e:
@@ -343,7 +666,3 @@ def generate_pdf(data_dict):
             valid_img_count += 1
             
         c.showPage()
-
-    c.save()
-    buffer.seek(0)
-    return buffer
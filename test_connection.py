@@ -4,13 +4,105 @@ Google Services 连接测试脚本
 """
 
 import io
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
-from connection import get_credentials, save_to_sheets, load_data
+from connection import cached_credentials, get_worksheet, with_retry
 from drive_handler import upload_to_drive
 
+DRIVE_ERROR_HINTS = (
+    "\n可能的原因:\n"
+    "  - Drive 文件夹未与 Service Account 共享（需要编辑者权限）\n"
+    "  - Folder ID 错误\n"
+    "  - Google Drive API 未启用"
+)
+
+def _do_sheets_write(spreadsheet_id, test_data):
+    """
+    写入一行测试数据，并直接从响应中读取写入结果验证
+    （values.append + includeValuesInResponse，一次请求完成写入和读取）
+    
+    Returns:
+        tuple: (ok, message)
+    """
+    try:
+        worksheet = get_worksheet(spreadsheet_id)
+        resp = with_retry(worksheet.spreadsheet.values_append, idempotent=False)(
+            f"'{worksheet.title}'!A1",
+            params={
+                'valueInputOption': 'RAW',
+                'insertDataOption': 'INSERT_ROWS',
+                'includeValuesInResponse': True,
+                'responseValueRenderOption': 'UNFORMATTED_VALUE'
+            },
+            body={'values': [list(test_data.values())]}
+        )
+        updated = resp['updates']['updatedData']
+        return True, (
+            "[测试 2] ✅ Google Sheets 写入成功\n"
+            f"[测试 2.1] ✅ 数据验证成功: {updated['range']}\n"
+            f"   {updated.get('values', [])}"
+        )
+    except Exception as e:
+        return False, (
+            f"[测试 2] ❌ Google Sheets 操作失败: {str(e)}\n"
+            "\n可能的原因:\n"
+            "  - Spreadsheet 未与 Service Account 共享\n"
+            "  - Spreadsheet ID 错误\n"
+            "  - Google Sheets API 未启用"
+        )
+
+def _do_drive_upload(folder_id, now):
+    """
+    生成测试文件并上传到 Drive（PIL 不可用时改用文本文件）
+    
+    Args:
+        folder_id: 目标文件夹 ID
+        now: 本次测试统一使用的时间戳（datetime）
+    
+    Returns:
+        tuple: (ok, message)
+    """
+    try:
+        try:
+            # 创建测试图片（纯色梯度）
+            from PIL import Image
+            
+            # 创建渐变图像：先算出每行的颜色，再横向广播（无逐行 Python 循环）
+            width, height = 400, 300
+            y = np.arange(height, dtype=np.float32)[:, None] / height
+            # 从蓝色渐变到紫色
+            row = np.concatenate([100 + 155 * y, 100 - 100 * y, 255 - 100 * y], axis=1).astype(np.uint8)
+            arr = np.broadcast_to(row[:, None, :], (height, width, 3)).copy()
+            image = Image.fromarray(arr, 'RGB')
+            
+            # 转换为 BytesIO（upload_to_drive 会自行 seek(0) 并直接流式读取，无需复制）
+            file_bytes = io.BytesIO()
+            image.save(file_bytes, format='PNG', optimize=False, compress_level=1)  # 测试只验证上传路径，无需高压缩
+            
+            filename = f"test_image_{now:%Y%m%d_%H%M%S}.png"
+            note = ""
+        except ImportError:
+            # 创建简单的文本文件
+            text_content = f"Test upload at {now}\nConnection test successful!"
+            file_bytes = io.BytesIO(text_content.encode('utf-8'))
+            
+            filename = f"test_file_{now:%Y%m%d_%H%M%S}.txt"
+            note = "⚠️ PIL/Pillow 未安装，使用文本文件测试...\n"
+        
+        link = upload_to_drive(file_bytes, folder_id, filename)
+        return True, (
+            f"[测试 3] {note}✅ Google Drive 上传成功\n"
+            f"   文件名: {filename}\n"
+            f"   链接: {link}"
+        )
+    except Exception as e:
+        return False, f"[测试 3] ❌ Google Drive 上传失败: {str(e)}\n{DRIVE_ERROR_HINTS}"
+
 def test_google_connection():
     """
     执行完整的连接性测试
+    Sheets 写入验证和 Drive 上传互不依赖，并发执行
     """
     print("=" * 60)
     print("🚀 开始 Google Services 连接测试")
@@ -19,7 +111,7 @@ def test_google_connection():
     # 测试 1: 认证测试
     print("\n[测试 1] Google 用户认证...")
     try:
-        credentials = get_credentials()
+        credentials = cached_credentials()
         print("✅ 用户认证成功")
     except Exception as e:
         print(f"❌ 认证失败: {str(e)}")
@@ -29,109 +121,42 @@ def test_google_connection():
         print("  - token.json 已损坏")
         return False
     
-    # 测试 2: Google Sheets 写入测试
-    print("\n[测试 2] Google Sheets 写入测试...")
-    
-    # 获取用户输入的 Spreadsheet ID
+    # 先收集全部输入，后续网络操作才能并发进行
     print("\n请提供 Google Spreadsheet ID:")
     print("(可在 Google Sheets URL 中找到，格式: https://docs.google.com/spreadsheets/d/SPREADSHEET_ID/edit)")
     spreadsheet_id = input("Spreadsheet ID: ").strip()
     
+    print("\n请提供 Google Drive 文件夹 ID:")
+    print("(可在文件夹 URL 中找到，格式: https://drive.google.com/drive/folders/FOLDER_ID)")
+    folder_id = input("Folder ID: ").strip()
+    
     if not spreadsheet_id:
-        print("❌ 未提供 Spreadsheet ID，跳过 Sheets 测试")
-    else:
-        try:
+        print("\n[测试 2] ❌ 未提供 Spreadsheet ID，跳过 Sheets 测试")
+    if not folder_id:
+        print("\n[测试 3] ❌ 未提供 Folder ID，跳过 Drive 测试")
+    
+    # 本次测试的统一时间戳（Sheets 记录与上传文件名一致，便于对照）
+    now = datetime.now()
+    
+    # 测试 2 + 测试 3: 并发执行，结果按完成顺序打印
+    with ThreadPoolExecutor(max_workers=2) as ex:
+        futures = []
+        if spreadsheet_id:
+            print("\n[测试 2] Google Sheets 写入测试...")
             test_data = {
-                'Timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                'Timestamp': now.strftime("%Y-%m-%d %H:%M:%S"),
                 'Column1': 'Test',
                 'Column2': 'Connection',
                 'Column3': 'Success'
             }
-            save_to_sheets(test_data, spreadsheet_id)
-            print("✅ Google Sheets 写入成功")
-            
-            # 尝试读取数据验证
-            print("\n[测试 2.1] 验证数据读取...")
-            df = load_data(spreadsheet_id)
-            print(f"✅ 数据读取成功，共 {len(df)} 行")
-            print("\n最新 3 行数据:")
-            print(df.tail(3))
-            
-        except Exception as e:
-            print(f"❌ Google Sheets 操作失败: {str(e)}")
-            print("\n可能的原因:")
-            print("  - Spreadsheet 未与 Service Account 共享")
-            print("  - Spreadsheet ID 错误")
-            print("  - Google Sheets API 未启用")
-    
-    # 测试 3: Google Drive 上传测试
-    print("\n[测试 3] Google Drive 上传测试...")
-    
-    # 获取用户输入的 Drive Folder ID
-    print("\n请提供 Google Drive 文件夹 ID:")
-    print("(可在文件夹 URL 中找到，格式: https://drive.google.com/drive/folders/FOLDER_ID)")
-    folder_id = input("Folder ID: ").strip()
-    
-    if not folder_id:
-        print("❌ 未提供 Folder ID，跳过 Drive 测试")
-    else:
-        print("ℹ️ 使用 OAuth 用户凭证，文件将自动归属到您的账号")
-        try:
-            # 创建测试图片（纯色梯度）
-            print("正在生成测试图片...")
-            from PIL import Image, ImageDraw
-            
-            # 创建渐变图像
-            width, height = 400, 300
-            image = Image.new('RGB', (width, height))
-            draw = ImageDraw.Draw(image)
-            
-            for y in range(height):
-                # 从蓝色渐变到紫色
-                r = int(100 + (155 * y / height))
-                g = int(100 - (100 * y / height))
-                b = int(255 - (100 * y / height))
-                draw.line([(0, y), (width, y)], fill=(r, g, b))
-            
-            # 转换为 BytesIO
-            img_bytes = io.BytesIO()
-            image.save(img_bytes, format='PNG')
-            img_bytes.seek(0)
-            
-            
-            filename = f"test_image_{datetime.now().strftime('%Y%m%d_%H%M%S')}.png"
-            link = upload_to_drive(img_bytes, folder_id, filename)
-            
-            print(f"✅ Google Drive 上传成功")
-            print(f"   文件名: {filename}")
-            print(f"   链接: {link}")
-            
-        except ImportError:
-            print("⚠️ PIL/Pillow 未安装，使用文本文件测试...")
-            try:
-                # 创建简单的文本文件
-                text_content = f"Test upload at {datetime.now()}\nConnection test successful!"
-                text_bytes = io.BytesIO(text_content.encode('utf-8'))
-                
-                filename = f"test_file_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
-                link = upload_to_drive(text_bytes, folder_id, filename)
-                
-                print(f"✅ Google Drive 上传成功")
-                print(f"   文件名: {filename}")
-                print(f"   链接: {link}")
-                
-            except Exception as e:
-                print(f"❌ Google Drive 上传失败: {str(e)}")
-                print("\n可能的原因:")
-                print("  - Drive 文件夹未与 Service Account 共享（需要编辑者权限）")
-                print("  - Folder ID 错误")
-                print("  - Google Drive API 未启用")
-        except Exception as e:
-            print(f"❌ Google Drive 上传失败: {str(e)}")
-            print("\n可能的原因:")
-            print("  - Drive 文件夹未与 Service Account 共享（需要编辑者权限）")
-            print("  - Folder ID 错误")
-            print("  - Google Drive API 未启用")
+            futures.append(ex.submit(_do_sheets_write, spreadsheet_id, test_data))
+        if folder_id:
+            print("\n[测试 3] Google Drive 上传测试...")
+            futures.append(ex.submit(_do_drive_upload, folder_id, now))
+        
+        for future in as_completed(futures):
+            _, message = future.result()
+            print(f"\n{message}")
     
     print("\n" + "=" * 60)
     print("🎉 测试完成！")
@@ -3,8 +3,8 @@
 用最简单的文件和配置测试是否真的是配额问题
 """
 
-from connection import get_credentials
-from googleapiclient.discovery import build
+from connection import cached_credentials, with_retry
+from drive_handler import get_drive_http, get_drive_service
 from googleapiclient.http import MediaIoBaseUpload
 import io
 
@@ -25,8 +25,9 @@ def minimal_upload_test():
     try:
         # 认证
         print("\n[1] 认证...")
-        credentials = get_credentials()
-        service = build('drive', 'v3', credentials=credentials)
+        credentials = cached_credentials()
+        service = get_drive_service()  # 进程内共享的 Drive service（静态 discovery，不重复 build）
+        http = get_drive_http()  # 当前线程复用的已授权连接（重试时不再重新握手 TLS）
         print(f"✅ Service Account: {credentials.service_account_email}")
         
         # 创建最小文件（只有几个字节）
@@ -54,13 +55,15 @@ def minimal_upload_test():
             resumable=False  # 确认禁用断点续传
         )
         
-        uploaded_file = service.files().create(
+        # 对 429/5xx 都退避重试：这里只是 5 字节的诊断文件，重试产生重复的 test.txt 无害，
+        # 而把临时 5xx 误判为"上传失败"会误导诊断
+        uploaded_file = with_retry(lambda: service.files().create(
             body=file_metadata,
             media_body=media,
             fields='id, webViewLink, name, size',
             supportsAllDrives=True,
             supportsTeamDrives=True
-        ).execute()
+        ).execute(http=http), idempotent=True)()
         
         print("\n✅ 上传成功！")
         print(f"  File ID: {uploaded_file.get('id')}")